@@ -3,30 +3,26 @@
 import argparse
 import csv
 import datetime as dt
+import functools
+import io
+import itertools
 import logging
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import dateutil.parser
-import holidays
-import Levenshtein
 from dateutil.easter import easter
 from fpdf import FPDF
+from rapidfuzz.distance import Levenshtein
 
 import config
 
-
-class DanishBankHolidays(holidays.DK):
-    """Bank holidays in Denmark in addition to normal holidays."""
-
-    def _populate(self, year):
-        holidays.DK._populate(self, year)
-        self[
-            easter(year) + dt.timedelta(days=40)  # Day after Ascension Day
-        ] = "Banklukkedag"
-        self[dt.date(year, 6, 5)] = "Banklukkedag"  # Danish Constitution Day
-        self[dt.date(year, 12, 24)] = "Banklukkedag"  # Christmas Eve
-        self[dt.date(year, 12, 31)] = "Banklukkedag"  # New Year's Eve
+# Read once, since they are used for every transaction and PDF page
+REGISTRATION_FEE = config.stregsystem.getint("registration_fee")
+MAX_EDIT_DISTANCE = config.stregsystem.getint("max_edit_distance")
+MP_NUMBER = config.stregsystem.get("mp_number")
+IS_STREGSYSTEM = MP_NUMBER == "90601"  # Otherwise, transfers are treated as sales
 
 
 class RegistrationHandler:
@@ -43,7 +39,13 @@ class RegistrationHandler:
         "indmelding",
         "indmeldelse",
     ]
-    maxLevenDist = config.stregsystem.getint("max_edit_distance")
+    registrationKeywordSet = frozenset(registrationKeywords)
+    maxLevenDist = MAX_EDIT_DISTANCE
+    wordSeparator = re.compile(r"\W+")
+    # Shorter comments can't contain any word close enough to a keyword
+    minCommentLength = (
+        min(len(keyword) for keyword in registrationKeywords) - maxLevenDist
+    )
 
     def __init__(self, amount, date, comment):
         self.amount = amount
@@ -57,13 +59,26 @@ class RegistrationHandler:
         registration keywords are common.
         """
 
-        commentSplit = re.split("\W+", self.comment)
+        commentSplit = self.wordSeparator.split(self.comment)
 
         if len(commentSplit) >= 2:  # At least username and keyword
+            # Only lowercased here, as most comments are just a username
+            commentWords = [commentWord.lower() for commentWord in commentSplit]
+            # Correctly spelled keywords are caught by one set lookup per word
+            if not self.registrationKeywordSet.isdisjoint(commentWords):
+                return True
+
             for keyword in self.registrationKeywords:
-                for commentWord in commentSplit:
+                for commentWord in commentWords:
+                    # Words whose lengths differ more can't be close enough
+                    if abs(len(commentWord) - len(keyword)) > self.maxLevenDist:
+                        continue
+
+                    # Stops computing as soon as the distance exceeds the cutoff
                     if (
-                        Levenshtein.distance(commentWord.lower(), keyword)
+                        Levenshtein.distance(
+                            commentWord, keyword, score_cutoff=self.maxLevenDist
+                        )
                         <= self.maxLevenDist
                     ):
                         return True
@@ -73,7 +88,7 @@ class RegistrationHandler:
     def isWrongRegistrationAmount(self):
         """Checks if the person has sent enough money for registration."""
 
-        return self.amount < config.stregsystem.getint("registration_fee")
+        return self.amount < REGISTRATION_FEE
 
     def warnAboutWrongAmount(self):
         """Shows warning if registration transfer includes enough money."""
@@ -86,7 +101,25 @@ class RegistrationHandler:
 
 
 class Transaction:
-    """A transaction with relevant information."""
+    """A transaction with relevant information.
+
+    Uses __slots__ instead of an attribute dict, since there is one instance per
+    transaction in the infile. Unset slots make hasattr return False, as before.
+    """
+
+    __slots__ = (
+        "event",
+        "amount",
+        "dateAndTime",
+        "customerName",
+        "comment",
+        "mpFee",
+        "date",
+        "time",
+        "isRegistration",
+        "voucherAmount",
+        "vat",
+    )
 
     SALG = "Payment"
     REFUNDERING = "Refund"
@@ -123,14 +156,13 @@ class Transaction:
         """
 
         if self.isDone():
-            self.amount = int(self.amount.replace(",", "").replace(".", ""))
-            self.mpFee = int(
-                self.mpFee.replace("-", "").replace(",", "").replace(".", "")
-            )
+            self.amount = int(self.amount.translate(AMOUNT_SEPARATORS))
+            self.mpFee = int(self.mpFee.translate(FEE_SEPARATORS))
+            self.vat = calculateVat(self.amount)
 
-            parsedDateAndTime = dateutil.parser.parse(self.dateAndTime)
-            self.date = parsedDateAndTime.date()
-            self.time = parsedDateAndTime.time()
+            # Fixed ISO 8601 format, e.g. "2020-12-06T10:29:16.7878103+01:00"
+            self.date = dt.date.fromisoformat(self.dateAndTime[:10])
+            self.time = dt.time.fromisoformat(self.dateAndTime[11:19])
 
             self.checkAndEnterRegistration()
         else:
@@ -141,25 +173,47 @@ class Transaction:
 
         Creates a RegistrationHandler to check if the amount transferred
         is enough, and if the words in the comment matches a registration
-        keyword.
+        keyword. Comments too short to contain a keyword, e.g. empty ones,
+        are skipped without creating a handler.
         """
 
-        regHandler = RegistrationHandler(self.amount, self.date, self.comment)
+        if len(self.comment) >= RegistrationHandler.minCommentLength:
+            regHandler = RegistrationHandler(self.amount, self.date, self.comment)
 
-        if regHandler.isIntendedRegistration():
-            self.isRegistration = True
-            self.voucherAmount = self.amount - config.stregsystem.getint(
-                "registration_fee"
-            )
-            if regHandler.isWrongRegistrationAmount():
-                regHandler.warnAboutWrongAmount()
-        else:
-            self.isRegistration = False
-            self.voucherAmount = self.amount
+            if regHandler.isIntendedRegistration():
+                self.isRegistration = True
+                self.voucherAmount = self.amount - REGISTRATION_FEE
+                if regHandler.isWrongRegistrationAmount():
+                    regHandler.warnAboutWrongAmount()
+                return
+
+        self.isRegistration = False
+        self.voucherAmount = self.amount
 
 
 class TransactionBatch:
-    """A day's worth of transactions."""
+    """A day's worth of transactions.
+
+    Uses __slots__ like Transaction, since all attributes are set in __init__.
+    """
+
+    __slots__ = (
+        "transactions",
+        "totalAmount",
+        "transferDate",
+        "mpFees",
+        "registrationFees",
+        "registrations",
+        "voucherAmount",
+        "vat",
+        "registrationVat",
+        "toBank",
+        "bankTransferDate",
+        "transferDateText",
+        "bankTransferDateText",
+        "transactionsByType",
+        "isCommitted",
+    )
 
     def __init__(self):
         self.transactions = []
@@ -169,8 +223,13 @@ class TransactionBatch:
         self.registrationFees = 0
         self.registrations = 0
         self.voucherAmount = 0
+        self.vat = 0
+        self.registrationVat = 0
         self.toBank = 0
         self.bankTransferDate = None
+        self.transferDateText = None
+        self.bankTransferDateText = None
+        self.transactionsByType = {}
         self.isCommitted = False
 
     def add_transaction(self, transaction):
@@ -183,7 +242,6 @@ class TransactionBatch:
 
         if transaction.isRegistration:
             self.registrations += 1
-            self.registrationFees += config.stregsystem.getint("registration_fee")
 
     def isActive(self):
         """Does the batch currently have any transactions?"""
@@ -191,11 +249,28 @@ class TransactionBatch:
         return len(self.transactions) > 0
 
     def commit(self):
-        """Sets the relevant dates, calculates the amount of money for the bank."""
+        """Sets the relevant dates, calculates the amount of money for the bank.
+
+        Registration fees are computed once for the whole batch from the number
+        of registrations, instead of being accumulated per transaction.
+        """
 
         self.transferDate = self.transactions[0].date
         self.bankTransferDate = nextBusinessDay(self.transferDate)
+        # Formatted once here, since both the CSV and the PDF need them
+        self.transferDateText = toDanishDateFormat(self.transferDate)
+        self.bankTransferDateText = toDanishDateFormat(self.bankTransferDate)
         self.toBank = self.totalAmount - self.mpFees
+        self.registrationFees = self.registrations * REGISTRATION_FEE
+        self.vat = calculateVat(self.totalAmount)
+        self.registrationVat = calculateVat(self.registrationFees)
+
+        # Grouped once here, instead of scanning all transactions per lookup
+        for transaction in self.transactions:
+            self.transactionsByType.setdefault(transaction.event, []).append(
+                transaction
+            )
+
         self.isCommitted = True
 
     def getTransactionsByType(self, event):
@@ -207,44 +282,49 @@ class TransactionBatch:
         if not self.isCommitted:
             raise UserWarning("Transaction batch is not committed yet.")
 
-        return [t for t in self.transactions if t.event == event]
+        return self.transactionsByType.get(event, [])
 
 
 class PDF(FPDF):
     """ Class whose purpose is to redefine existing header and footer from FPDF."""
 
+    # Table header for every page, chosen once instead of per page
+    if IS_STREGSYSTEM:
+        tableHeader = (
+            ("Kl.", "R"),
+            ("Besked", "L"),
+            ("Tilm.gebyr, kr.", "R"),
+            ("Indb., kr.", "R"),
+            ("MP-gebyr, kr.", "R"),
+            ("Gavekort, kr.", "R"),
+        )
+        colWidths = (11, 82, 25, 20, 26, 25)  # Seems to work well with A4
+    else:  # Sales layout
+        tableHeader = (
+            ("Kl.", "R"),
+            ("Navn", "L"),
+            ("Indb., kr.", "R"),
+            ("Moms, kr.", "R"),
+            ("MP-gebyr, kr.", "R"),
+        )
+        colWidths = (11, 101, 26, 23, 28)
+
     def header(self):
         if self.page_no() != 1:  # Header is different for first page
-            if config.stregsystem.get("mp_number") == "90601":
-                tableHeader = [
-                    ("Kl.", "R"),
-                    ("Besked", "L"),
-                    ("Tilm.gebyr, kr.", "R"),
-                    ("Indb., kr.", "R"),
-                    ("MP-gebyr, kr.", "R"),
-                    ("Gavekort, kr.", "R"),
-                ]
-                colWidths = [11, 82, 25, 20, 26, 25]  # Seems to work well with A4
-            else:  # Sales layout
-                tableHeader = [
-                    ("Kl.", "R"),
-                    ("Navn", "L"),
-                    ("Indb., kr.", "R"),
-                    ("Moms, kr.", "R"),
-                    ("MP-gebyr, kr.", "R"),
-                ]
-                colWidths = [11, 101, 26, 23, 28]
-
-            for i, col in enumerate(tableHeader):
-                self.cell(
-                    colWidths[i], 1.5 * self.font_size, col[0], border="B", align=col[1]
-                )
-            self.ln(2 * self.font_size)
+            self.setTableHeader()
+
+    def setTableHeader(self):
+        """Column names of the transaction table, as on the first page."""
+
+        headerHeight = 1.5 * self.font_size
+        for i, col in enumerate(self.tableHeader):
+            self.cell(self.colWidths[i], headerHeight, col[0], border="B", align=col[1])
+        self.ln(2 * self.font_size)
 
     def footer(self):
         self.alias_nb_pages()
         self.set_y(-15)
-        self.set_font("Arial", "", 8)
+        self.set_font("Helvetica", "", 8)
         self.cell(0, 10, str(self.page_no()) + "/{nb}", align="C")
 
 
@@ -253,109 +333,86 @@ class Layout:
     def setFklubInfo(pdf):
         """Three lines of text with F-klubben's actual name, CVR, and website."""
 
-        pdf.set_font("Arial", "", 7)
+        pdf.set_font("Helvetica", "", 7)
         pdf.multi_cell(
-            0, 3.5, "F-Klubben-Institut for Datalogi\nCVR: 16427888\nhttps://fklub.dk/"
+            0,
+            3.5,
+            "F-Klubben-Institut for Datalogi\nCVR: 16427888\nhttps://fklub.dk/",
+            new_x="LMARGIN",  # Continue below the text, like PyFPDF did
+            new_y="NEXT",
         )
 
     @staticmethod
-    def salesLayout(pdf, transBatch, title):
-        setNormalFont = lambda: pdf.set_font("Arial", "", 10.0)
+    def setHeader(pdf, transBatch, title):
+        """Title, logo, appendix date, and F-klubben's info at the top of the PDF."""
 
-        # Header
         pdf.ln(5)
-        pdf.set_font("Arial", "B", 16.0)
+        pdf.set_font("Helvetica", "B", 16.0)
         pdf.cell(157, 25.0, title)
         pdf.image("images/f-klubben.png", w=30)
         pdf.ln(0.1)
 
-        setNormalFont()
-        pdf.cell(
-            155, -10, "Bilagsdato: " + toDanishDateFormat(transBatch.bankTransferDate)
-        )
+        pdf.set_font("Helvetica", "", 10.0)
+        pdf.cell(155, -10, "Bilagsdato: " + transBatch.bankTransferDateText)
         Layout.setFklubInfo(pdf)
 
         pdf.ln(-1 * pdf.font_size)
 
-        # High-level information about a transaction batch.
-        setNormalFont()
+    @staticmethod
+    def setBatchInfo(pdf, infoRows):
+        """High-level information about a transaction batch.
+
+        Each row is a label and its value, which are the only things differing
+        between the layouts.
+        """
+
+        pdf.set_font("Helvetica", "", 10.0)
         infoLabelWidth = 60
         infoValueWidth = 20
         infoSpace = 1.5 * pdf.font_size
 
-        pdf.set_font("Arial", "B", 10.0)
+        pdf.set_font("Helvetica", "B", 10.0)
         pdf.cell(0, 0, "Oplysninger")
-        pdf.ln(infoSpace)
-
-        setNormalFont()
-        pdf.cell(infoLabelWidth, 0, "Dato for indbetalinger:")
-        pdf.cell(
-            infoValueWidth, 0, toDanishDateFormat(transBatch.transferDate), align="R"
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Antal indbetalinger:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            str(len(transBatch.getTransactionsByType(Transaction.SALG))),
-            align="R",
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "MobilePay-gebyr, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.mpFees, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
 
-        pdf.cell(infoLabelWidth, 0, "Indbetalt inkl. moms, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.totalAmount, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
+        pdf.set_font("Helvetica", "", 10.0)
+        for label, value in infoRows:
+            pdf.ln(infoSpace)
+            pdf.cell(infoLabelWidth, 0, label)
+            pdf.cell(infoValueWidth, 0, value, align="R")
 
-        pdf.cell(infoLabelWidth, 0, "Moms, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.totalAmount * 0.2, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
+        pdf.ln(3 * pdf.font_size)
 
-        pdf.cell(infoLabelWidth, 0, "Til banken, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.toBank, grouping=True),
-            align="R",
+    @staticmethod
+    def salesLayout(pdf, transBatch, title):
+        setNormalFont = lambda: pdf.set_font("Helvetica", "", 10.0)
+
+        Layout.setHeader(pdf, transBatch, title)
+        Layout.setBatchInfo(
+            pdf,
+            [
+                ("Dato for indbetalinger:", transBatch.transferDateText),
+                (
+                    "Antal indbetalinger:",
+                    str(len(transBatch.getTransactionsByType(Transaction.SALG))),
+                ),
+                (
+                    "MobilePay-gebyr, kr.:",
+                    toDecimalNumber(transBatch.mpFees, grouping=True),
+                ),
+                (
+                    "Indbetalt inkl. moms, kr.:",
+                    toDecimalNumber(transBatch.totalAmount, grouping=True),
+                ),
+                ("Moms, kr.:", toDecimalNumber(transBatch.vat, grouping=True)),
+                ("Til banken, kr.:", toDecimalNumber(transBatch.toBank, grouping=True)),
+            ],
         )
-        pdf.ln(3 * pdf.font_size)
 
         setNormalFont()
+        pdf.setTableHeader()
 
-        header = [
-            ("Kl.", "R"),
-            ("Navn", "L"),
-            ("Indb., kr.", "R"),
-            ("Moms, kr.", "R"),
-            ("MP-gebyr, kr.", "R"),
-        ]
-        colWidths = [11, 101, 26, 23, 28]  # Seems to work well with A4
-
-        for i, col in enumerate(header):
-            pdf.cell(
-                colWidths[i], 1.5 * pdf.font_size, col[0], border="B", align=col[1]
-            )
-
-        pdf.ln(2 * pdf.font_size)
+        colWidths = pdf.colWidths
+        rowHeight = 2 * pdf.font_size  # Font size is the same for all rows
 
         # Table of information about each transaction. Numbers are right-aligned.
         for transaction in transBatch.transactions:
@@ -366,159 +423,80 @@ class Layout:
 
             pdf.cell(
                 colWidths[0],
-                2 * pdf.font_size,
-                str(transaction.time.strftime("%H:%M")),
+                rowHeight,
+                f"{transaction.time.hour:02d}:{transaction.time.minute:02d}",
                 align="R",
             )
             pdf.cell(
                 colWidths[1],
-                2 * pdf.font_size,
+                rowHeight,
                 transaction.customerName[:49],
                 align="L",
             )
             pdf.cell(
                 colWidths[2],
-                2 * pdf.font_size,
+                rowHeight,
                 toDecimalNumber(transaction.amount, grouping=True),
                 align="R",
             )
             pdf.cell(
                 colWidths[3],
-                2 * pdf.font_size,
-                toDecimalNumber(transaction.amount * 0.2),
+                rowHeight,
+                toDecimalNumber(transaction.vat),
                 align="R",
-            ),
+            )
             pdf.cell(
                 colWidths[4],
-                2 * pdf.font_size,
+                rowHeight,
                 toDecimalNumber(transaction.mpFee, grouping=True),
                 align="R",
             )
-            pdf.ln(2 * pdf.font_size)
+            pdf.ln(rowHeight)
 
     @staticmethod
     def stregsystemLayout(pdf, transBatch, title):
-        setNormalFont = lambda: pdf.set_font("Arial", "", 10.0)
-
-        # Header
-        pdf.ln(5)
-        pdf.set_font("Arial", "B", 16.0)
-        pdf.cell(157, 25.0, title)
-        pdf.image("images/f-klubben.png", w=30)
-        pdf.ln(0.1)
-
-        setNormalFont()
-        pdf.cell(
-            155, -10, "Bilagsdato: " + toDanishDateFormat(transBatch.bankTransferDate)
+        setNormalFont = lambda: pdf.set_font("Helvetica", "", 10.0)
+
+        Layout.setHeader(pdf, transBatch, title)
+        Layout.setBatchInfo(
+            pdf,
+            [
+                ("Dato for indbetalinger:", transBatch.transferDateText),
+                (
+                    "Antal indbetalinger:",
+                    str(len(transBatch.getTransactionsByType(Transaction.SALG))),
+                ),
+                ("Antal tilmeldinger:", str(transBatch.registrations)),
+                (
+                    "MobilePay-gebyr, kr.:",
+                    toDecimalNumber(transBatch.mpFees, grouping=True),
+                ),
+                (
+                    "Indbetalt, kr.:",
+                    toDecimalNumber(transBatch.totalAmount, grouping=True),
+                ),
+                ("Til banken, kr.:", toDecimalNumber(transBatch.toBank, grouping=True)),
+                (
+                    "Gavekort, kr.:",
+                    toDecimalNumber(transBatch.voucherAmount, grouping=True),
+                ),
+                (
+                    "Tilmeldingsgebyr inkl. moms, kr.:",
+                    toDecimalNumber(transBatch.registrationFees, grouping=True),
+                ),
+                (
+                    "Moms, kr.:",
+                    toDecimalNumber(transBatch.registrationVat, grouping=True),
+                ),
+            ],
         )
-        Layout.setFklubInfo(pdf)
 
-        pdf.ln(-1 * pdf.font_size)
-
-        # High-level information about a transaction batch.
         setNormalFont()
-        infoLabelWidth = 60
-        infoValueWidth = 20
-        infoSpace = 1.5 * pdf.font_size
+        pdf.setTableHeader()
 
-        pdf.set_font("Arial", "B", 10.0)
-        pdf.cell(0, 0, "Oplysninger")
-        pdf.ln(infoSpace)
-
-        setNormalFont()
-        pdf.cell(infoLabelWidth, 0, "Dato for indbetalinger:")
-        pdf.cell(
-            infoValueWidth, 0, toDanishDateFormat(transBatch.transferDate), align="R"
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Antal indbetalinger:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            str(len(transBatch.getTransactionsByType(Transaction.SALG))),
-            align="R",
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Antal tilmeldinger:")
-        pdf.cell(infoValueWidth, 0, str(transBatch.registrations), align="R")
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "MobilePay-gebyr, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.mpFees, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Indbetalt, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.totalAmount, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Til banken, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.toBank, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Gavekort, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.voucherAmount, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Tilmeldingsgebyr inkl. moms, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.registrationFees, grouping=True),
-            align="R",
-        )
-        pdf.ln(infoSpace)
-
-        pdf.cell(infoLabelWidth, 0, "Moms, kr.:")
-        pdf.cell(
-            infoValueWidth,
-            0,
-            toDecimalNumber(transBatch.registrationFees * 0.2, grouping=True),
-            align="R",
-        )
-        pdf.ln(3 * pdf.font_size)
-
-        transBatch.getTransactionsByType(Transaction.REFUNDERING)
-
-        setNormalFont()
-
-        header = [
-            ("Kl.", "R"),
-            ("Besked", "L"),
-            ("Tilm.gebyr, kr.", "R"),
-            ("Indb., kr.", "R"),
-            ("MP-gebyr, kr.", "R"),
-            ("Gavekort, kr.", "R"),
-        ]
-        colWidths = [11, 82, 25, 20, 26, 25]  # Seems to work well with A4
-
-        for i, col in enumerate(header):
-            pdf.cell(
-                colWidths[i], 1.5 * pdf.font_size, col[0], border="B", align=col[1]
-            )
-
-        pdf.ln(2 * pdf.font_size)
+        colWidths = pdf.colWidths
+        rowHeight = 2 * pdf.font_size  # Font size is the same for all rows
+        registrationFee = toDecimalNumber(REGISTRATION_FEE, grouping=True)
 
         # Table of information about each transaction. Numbers are right-aligned.
         for transaction in transBatch.transactions:
@@ -529,19 +507,17 @@ class Layout:
 
             pdf.cell(
                 colWidths[0],
-                2 * pdf.font_size,
-                str(transaction.time.strftime("%H:%M")),  # TODO
+                rowHeight,
+                f"{transaction.time.hour:02d}:{transaction.time.minute:02d}",  # TODO
                 align="R",
             )
             if transaction.comment:
-                pdf.cell(
-                    colWidths[1], 2 * pdf.font_size, transaction.comment[:49], align="L"
-                )
+                pdf.cell(colWidths[1], rowHeight, transaction.comment[:49], align="L")
             else:
-                pdf.set_font("Arial", "I", 10.0)
+                pdf.set_font("Helvetica", "I", 10.0)
                 pdf.cell(
                     colWidths[1],
-                    2 * pdf.font_size,
+                    rowHeight,
                     transaction.customerName[:49],
                     align="L",
                 )
@@ -549,65 +525,122 @@ class Layout:
 
             pdf.cell(
                 colWidths[2],
-                2 * pdf.font_size,
-                toDecimalNumber(
-                    config.stregsystem.getint("registration_fee"), grouping=True
-                )
-                if transaction.isRegistration
-                else "",
+                rowHeight,
+                registrationFee if transaction.isRegistration else "",
                 align="R",
             )
             pdf.cell(
                 colWidths[3],
-                2 * pdf.font_size,
+                rowHeight,
                 toDecimalNumber(transaction.amount, grouping=True),
                 align="R",
             )
             pdf.cell(
                 colWidths[4],
-                2 * pdf.font_size,
+                rowHeight,
                 toDecimalNumber(transaction.mpFee, grouping=True),
                 align="R",
             )
             pdf.cell(
                 colWidths[5],
-                2 * pdf.font_size,
+                rowHeight,
                 toDecimalNumber(transaction.voucherAmount, grouping=True),
                 align="R",
             )
-            pdf.ln(2 * pdf.font_size)
+            pdf.ln(rowHeight)
+
+
+# Characters outside this class are stripped from the infile before parsing
+UNWANTED_CHARACTERS = re.compile(r'[^a-åA-Å0-9-;()!"+,.:?@óöü\s]')
 
+# Translation tables removing separators from MP amounts, e.g. "1.234,56" -> "123456"
+AMOUNT_SEPARATORS = str.maketrans("", "", ",.")
+FEE_SEPARATORS = str.maketrans("", "", "-,.")  # Fees are negative in the infile
 
-DANISH_BANK_HOLIDAYS = DanishBankHolidays()
+ONE_DAY = dt.timedelta(days=1)
+
+MIN_PARALLEL_PDFS = 4  # Fewer batches are written without a process pool
 
 
 def toDecimalNumber(number, grouping=False):
     """Formats an amount of øre to kroner.
 
     Trying to avoid locale stuff, since the user might not have da_DK installed.
-    If thounsands grouping is checked, we need a third intermediate symbol for the
-    swapping of thousands separator and decimal separator. I've chosen the tilde.
+    The amount is split into kroner and øre with integer arithmetic, rounding
+    fractional øre (e.g. from VAT calculations), so no float formatting or swapping
+    of separators is needed.
 
     For the CSV, Dinero accepts no grouping, while it's nice to have in the PDFs.
     """
 
+    sign = "-" if number < 0 else ""
+    kroner, oere = divmod(round(abs(number)), 100)
+
     if grouping:
-        return (
-            "{:,.2f}".format(number / 100)
-            .replace(".", "~")
-            .replace(",", ".")
-            .replace("~", ",")
-        )
+        return sign + f"{kroner:,}".replace(",", ".") + f",{oere:02d}"
     else:
-        return "{:.2f}".format(number / 100).replace(".", ",")
+        return f"{sign}{kroner},{oere:02d}"
+
+
+def calculateVat(amount):
+    """Returns the VAT included in an amount of øre, rounded to whole øre.
+
+    Danish VAT is 25 % of the price without VAT, i.e. a fifth of the price with VAT.
+    Integer arithmetic keeps the amounts exact, and a fifth of a whole number of øre
+    can never end in exactly half an øre.
+    """
+
+    return (2 * amount + 5) // 10
 
 
+@functools.lru_cache(maxsize=None)
+def bankHolidays(year):
+    """Returns the days of a year, besides weekends, where Danish banks are closed.
+
+    These are the public holidays plus the extra bank closing days (Banklukkedage).
+    Built once per year, so lookups are plain set membership tests.
+    """
+
+    easterSunday = easter(year)
+    easterOffsets = [
+        -3,  # Maundy Thursday
+        -2,  # Good Friday
+        0,  # Easter Sunday
+        1,  # Easter Monday
+        39,  # Ascension Day
+        40,  # Day after Ascension Day, Banklukkedag
+        49,  # Whit Sunday
+        50,  # Whit Monday
+    ]
+    if year < 2024:  # Abolished from 2024
+        easterOffsets.append(26)  # General Prayer Day
+
+    return frozenset(
+        [easterSunday + dt.timedelta(days=offset) for offset in easterOffsets]
+        + [
+            dt.date(year, 1, 1),  # New Year's Day
+            dt.date(year, 6, 5),  # Danish Constitution Day, Banklukkedag
+            dt.date(year, 12, 24),  # Christmas Eve, Banklukkedag
+            dt.date(year, 12, 25),  # Christmas Day
+            dt.date(year, 12, 26),  # Boxing Day
+            dt.date(year, 12, 31),  # New Year's Eve, Banklukkedag
+        ]
+    )
+
+
+@functools.lru_cache(maxsize=None)
 def nextBusinessDay(date):
-    """Returns the next business day for bank transfer in dd-mm-yyyy format."""
+    """Returns the next business day for bank transfer in dd-mm-yyyy format.
 
-    nextDay = date + dt.timedelta(days=1)
-    while nextDay.weekday() in holidays.WEEKEND or nextDay in DANISH_BANK_HOLIDAYS:
-        nextDay += dt.timedelta(days=1)
+    The result only depends on the date, so it is cached.
+    """
+
+    nextDay = date + ONE_DAY
+    while (
+        nextDay.weekday() >= 5  # Saturday or Sunday
+        or nextDay in bankHolidays(nextDay.year)
+    ):
+        nextDay += ONE_DAY
 
     return nextDay
 
@@ -638,10 +671,19 @@ def readTransactionsFromFile(filePath, mpNumber):
     batches before bank transfer. Amount is in øre (1/100th of a krone).
     """
 
-    f = open(filePath, "r", newline="")
-    file = [re.sub('[^a-åA-Å0-9-;()!"+,.:?@óöü\s]', '', row) for row in f]
-    f.close()
-    reader = csv.DictReader(file, delimiter=";")
+    contents = UNWANTED_CHARACTERS.sub(
+        "", Path(filePath).read_bytes().decode("utf-8-sig")
+    )
+    reader = csv.reader(io.StringIO(contents, newline=""), delimiter=";")
+
+    # Resolve column positions once from the header instead of a dict per row
+    header = next(reader)
+    eventCol = header.index("Event")
+    amountCol = header.index("Amount")
+    dateAndTimeCol = header.index("Date and time")
+    customerNameCol = header.index("Customer name")
+    commentCol = header.index("Comment")
+    myShopNumberCol = header.index("MyShop-Number")
 
     transactionBatches = []
     currentBatch = TransactionBatch()
@@ -649,16 +691,23 @@ def readTransactionsFromFile(filePath, mpNumber):
     transferAmount = 0  # to mpNumber
     otherPlacesAmount = 0
 
+    # MP lists the newest transactions first, so the rows are walked backwards
+    rows = list(reader)
     newTrans = Transaction()
-    for index, row in reversed(list(enumerate(reader))):
-        if row["MyShop-Number"] == mpNumber:
-            if row["Event"] == Transaction.SALG:
+    for index, row in zip(reversed(range(len(rows))), reversed(rows)):
+        if not row:  # Blank line
+            continue
+
+        if row[myShopNumberCol] == mpNumber:
+            event = row[eventCol]
+
+            if event == Transaction.SALG:
                 newTrans.setattrs(
-                    event=row["Event"],
-                    amount=row["Amount"],
-                    dateAndTime=row["Date and time"],
-                    customerName=row["Customer name"],
-                    comment=row["Comment"],
+                    event=event,
+                    amount=row[amountCol],
+                    dateAndTime=row[dateAndTimeCol],
+                    customerName=row[customerNameCol],
+                    comment=row[commentCol],
                 )
 
                 newTrans.checkAndCommit()
@@ -667,21 +716,21 @@ def readTransactionsFromFile(filePath, mpNumber):
 
                 transferAmount += 1
 
-            elif row["Event"] == "Retainable":
-                newTrans.mpFee = row["Amount"]
+            elif event == "Retainable":
+                newTrans.mpFee = row[amountCol]
                 # if newTrans.event != None and newTrans.mpFee != None:
                 if hasattr(newTrans, "event") and hasattr(newTrans, "mpFee"):
                     newTrans.checkAndCommit()
                     currentBatch.add_transaction(newTrans)
                     newTrans = Transaction()
 
-            elif row["Event"] == Transaction.REFUNDERING:
+            elif event == Transaction.REFUNDERING:
                 refund = Transaction()
                 refund.setattrs(
-                    event=row["Event"],
-                    amount=row["Amount"],
-                    dateAndTime=row["Date and time"],
-                    customerName=row["Customer name"],
+                    event=event,
+                    amount=row[amountCol],
+                    dateAndTime=row[dateAndTimeCol],
+                    customerName=row[customerNameCol],
                     comment="",
                     mpFee="0",
                 )
@@ -689,28 +738,28 @@ def readTransactionsFromFile(filePath, mpNumber):
                 currentBatch.add_transaction(refund)
                 transferAmount += 1
 
-            elif row["Event"] == "Transfer":
+            elif event == "Transfer":
                 if currentBatch.isActive():
                     currentBatch.commit()
                     transactionBatches.append(currentBatch)
                     currentBatch = TransactionBatch()
 
-            elif row["Event"] == "ServiceFee":
+            elif event == "ServiceFee":
                 serviceFee = Transaction()
                 serviceFee.setattrs(
-                    event=row["Event"],
+                    event=event,
                     amount="0",
-                    dateAndTime=row["Date and time"],
+                    dateAndTime=row[dateAndTimeCol],
                     customerName="",
-                    comment=row["Comment"],
-                    mpFee=row["Amount"],
+                    comment=row[commentCol],
+                    mpFee=row[amountCol],
                 )
                 serviceFee.checkAndCommit()
                 currentBatch.add_transaction(serviceFee)
                 transferAmount += 1
             else:
                 raise ValueError(
-                    f"Line {str(index + 2)} in infile:\nUnknown transaction type '{row['Event']}'."
+                    f"Line {str(index + 2)} in infile:\nUnknown transaction type '{event}'."
                 )
         else:
             otherPlacesAmount += 1
@@ -736,107 +785,79 @@ def readTransactionsFromFile(filePath, mpNumber):
 
 def toDanishDateFormat(date):
     """Converts a yyyy-MM-dd date to dd-MM-yyyy as a string."""
-    return date.strftime("%d-%m-%Y")
+    return f"{date.day:02d}-{date.month:02d}-{date.year:04d}"
+
+
+def makeCsvLine(text, account):
+    """Returns a formatter for a Dinero CSV line with a fixed text and account.
+
+    The text and account are baked into the template once, so only appendix number,
+    date, and amount are filled in per line. The text may contain {transferDate}.
+    """
+
+    return ("{appendix};{date};" + text + ";" + account + ";{amount};\r\n").format
 
 
 def writeCsv(filePath, appendixStart, transactionsByBatch):
     """Writes the information gathered throughout the script to a CSV file.
     
     The resulting CSV file is recognized by Dinero's journal entry CSV import.
-    The written information is in Danish.
+    The written information is in Danish. All lines are gathered before the file
+    is opened, so they can be written in one go. The fields never contain ";" or
+    quotes, so no CSV quoting is needed.
     """
 
-    file = open(filePath, "w", newline="")
-    csvWriter = csv.writer(file, delimiter=";")
-
-    currAppendix = appendixStart
-
-    try:
-        csvWriter.writerow(["Bilag nr.", "Dato", "Tekst", "Konto", "Beløb", "Modkonto"])
-    except UnicodeEncodeError:
-        csvWriter.writerow(
-            ["Bilag nr.", "Dato", "Tekst", "Konto", "Beløb".encode("utf-8"), "Modkonto"]
-        )
-
-    for batch in transactionsByBatch:
-        if config.stregsystem.get("mp_number") == "90601":
-            csvWriter.writerow(
-                [
-                    currAppendix,
-                    toDanishDateFormat(batch.bankTransferDate),
-                    "MP fra " + batch.transferDate.strftime("%d-%m"),
-                    config.dinero.get("bank"),
-                    toDecimalNumber(batch.toBank),
-                    None,
-                ]
-            )
+    bankLine = makeCsvLine("MP fra {transferDate}", config.dinero.get("bank"))
+    voucherLine = makeCsvLine("Gavekort", config.dinero.get("gavekort"))
+    registrationLine = makeCsvLine("Tilmeldingsgebyr", config.dinero.get("salg"))
+    salesBankLine = makeCsvLine(
+        "Salg via MP fra {transferDate}", config.dinero.get("bank")
+    )
+    salesLine = makeCsvLine("Salg", config.dinero.get("salg"))
+    feeLine = makeCsvLine("MP-gebyr", config.dinero.get("gebyrer"))
+
+    lines = []
+    addLine = lines.append
+
+    for appendix, batch in enumerate(transactionsByBatch, appendixStart):
+        transferDate = batch.transferDate
+        fields = {
+            "appendix": appendix,
+            "date": batch.bankTransferDateText,
+            "transferDate": f"{transferDate.day:02d}-{transferDate.month:02d}",
+        }
+
+        if IS_STREGSYSTEM:
+            addLine(bankLine(amount=toDecimalNumber(batch.toBank), **fields))
             if batch.voucherAmount > 0:
-                csvWriter.writerow(
-                    [
-                        currAppendix,
-                        toDanishDateFormat(batch.bankTransferDate),
-                        "Gavekort",
-                        config.dinero.get("gavekort"),
-                        "-" + toDecimalNumber(batch.voucherAmount),
-                        None,
-                    ]
+                addLine(
+                    voucherLine(
+                        amount="-" + toDecimalNumber(batch.voucherAmount), **fields
+                    )
                 )
             if batch.registrations > 0:
-                csvWriter.writerow(
-                    [
-                        currAppendix,
-                        toDanishDateFormat(batch.bankTransferDate),
-                        "Tilmeldingsgebyr",
-                        config.dinero.get("salg"),
-                        "-" + toDecimalNumber(batch.registrationFees),
-                        None,
-                    ]
+                addLine(
+                    registrationLine(
+                        amount="-" + toDecimalNumber(batch.registrationFees), **fields
+                    )
                 )
-            csvWriter.writerow(
-                [
-                    currAppendix,
-                    toDanishDateFormat(batch.bankTransferDate),
-                    "MP-gebyr",
-                    config.dinero.get("gebyrer"),
-                    toDecimalNumber(batch.mpFees),
-                    None,
-                ]
-            )
+            addLine(feeLine(amount=toDecimalNumber(batch.mpFees), **fields))
         else:
-            csvWriter.writerow(
-                [
-                    currAppendix,
-                    toDanishDateFormat(batch.bankTransferDate),
-                    "Salg via MP fra " + batch.transferDate.strftime("%d-%m"),
-                    config.dinero.get("bank"),
-                    toDecimalNumber(batch.toBank),
-                    None,
-                ]
-            )
-            csvWriter.writerow(
-                [
-                    currAppendix,
-                    toDanishDateFormat(batch.bankTransferDate),
-                    "Salg",
-                    config.dinero.get("salg"),
-                    "-" + toDecimalNumber(batch.totalAmount),
-                    None,
-                ]
+            addLine(salesBankLine(amount=toDecimalNumber(batch.toBank), **fields))
+            addLine(
+                salesLine(amount="-" + toDecimalNumber(batch.totalAmount), **fields)
             )
-            csvWriter.writerow(
-                [
-                    currAppendix,
-                    toDanishDateFormat(batch.bankTransferDate),
-                    "MP-gebyr",
-                    config.dinero.get("gebyrer"),
-                    toDecimalNumber(batch.mpFees),
-                    None,
-                ]
+            addLine(feeLine(amount=toDecimalNumber(batch.mpFees), **fields))
+
+    with open(filePath, "w", newline="", buffering=1 << 20) as file:
+        try:
+            file.write("Bilag nr.;Dato;Tekst;Konto;Beløb;Modkonto\r\n")
+        except UnicodeEncodeError:
+            file.write(
+                f"Bilag nr.;Dato;Tekst;Konto;{'Beløb'.encode('utf-8')};Modkonto\r\n"
             )
 
-        currAppendix += 1
-
-    file.close()
+        file.write("".join(lines))
 
 
 def makePdfFilename(directory, appendixNumber):
@@ -872,32 +893,43 @@ def makeAppendixRange(appendixStart, appendixAmount):
 
 
 def handlePdfCreation(appendixStart, transactionBatches):
-    """Creates a PDF directory, and calls function that creates PDFs. Returns outdir."""
+    """Creates a PDF directory, and calls function that creates PDFs. Returns outdir.
+
+    The PDFs are independent of each other and FPDF is CPU-bound, so they are
+    written in parallel by a pool of processes. For only a few batches, starting
+    the processes costs more than it saves, so they are written one by one.
+    """
 
-    appendixNumber = appendixStart
     outdir = makeAppendixRange(appendixStart, len(transactionBatches))
     Path(outdir).mkdir(parents=True, exist_ok=True)
 
-    if config.stregsystem.get("mp_number") == "90601":
-        for batch in transactionBatches:
-            writePdf(
-                batch,
-                outdir,
-                appendixNumber,
-                Layout.stregsystemLayout,
-                config.stregsystem.get("stregsystem_title"),
-            )
-            appendixNumber += 1
+    if IS_STREGSYSTEM:
+        layout = Layout.stregsystemLayout
+        title = config.stregsystem.get("stregsystem_title")
     else:
-        for batch in transactionBatches:
-            writePdf(
-                batch,
-                outdir,
-                appendixNumber,
-                Layout.salesLayout,
-                config.stregsystem.get("sales_title"),
+        layout = Layout.salesLayout
+        title = config.stregsystem.get("sales_title")
+
+    if len(transactionBatches) < MIN_PARALLEL_PDFS:
+        for appendixNumber, batch in enumerate(transactionBatches, appendixStart):
+            writePdf(batch, outdir, appendixNumber, layout, title)
+        return outdir
+
+    # A few batches per task, so long exports don't pay one round trip per PDF
+    chunksize = max(1, len(transactionBatches) // (4 * (os.cpu_count() or 1)))
+    with ProcessPoolExecutor() as executor:
+        # Consumed to wait for all PDFs and re-raise any errors from the workers
+        list(
+            executor.map(
+                writePdf,
+                transactionBatches,
+                itertools.repeat(outdir),
+                itertools.count(appendixStart),
+                itertools.repeat(layout),
+                itertools.repeat(title),
+                chunksize=chunksize,
             )
-            appendixNumber += 1
+        )
 
     return outdir
 
@@ -912,9 +944,7 @@ def main():
     try:
         transactionBatches = readTransactionsFromFile(
             args.infile,
-            config.stregsystem.get("mp_number")
-            if not args.mp_number
-            else args.mp_number,
+            MP_NUMBER if not args.mp_number else args.mp_number,
         )
     except ValueError as e:
         logging.error(e)